@@ -1,13 +1,46 @@
-import json
+import asyncio
+import functools
+import hashlib
+import itertools
+import logging
 import os
-from supabase import create_client, Client
-from openai import OpenAI
-from typing import Dict, Any, List
-import time
+from collections import defaultdict, deque
+import httpx
+from supabase import create_client, Client, ClientOptions
+from openai import AsyncOpenAI, APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+from typing import Dict, Any, Iterator, List, Optional
+import ijson
+import msgspec
+import orjson
+import tiktoken
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential_jitter
 from dotenv import load_dotenv
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL = "text-embedding-ada-002"
+# OpenAI limits for a single embeddings request (tokens kept a little under the 300k cap)
+MAX_INPUTS_PER_REQUEST = 2048
+MAX_TOKENS_PER_INPUT = 8191
+MAX_TOKENS_PER_REQUEST = 290_000
+# Number of embedding requests allowed in flight at once; raise it on higher rate-limit tiers
+OPENAI_CONCURRENCY = int(os.getenv("OPENAI_CONCURRENCY", "8"))
+
+HTTP_TIMEOUT = 30
+
+# Shorter texts carry nothing worth embedding (e.g. products with none of the expected fields)
+MIN_TEXT_LENGTH = 8
+
+
+# Top-level product fields embedded as text, in order, with a pre-bound formatter for each
+TEXT_FIELDS = (
+    ("title", "Product Title: {}".format),
+    ("description", "Description: {}".format),
+    ("price", "Price: ${}".format),
+)
+
 def initialize_clients():
     supabase_url = os.getenv("SUPABASE_URL")
     supabase_key = os.getenv("SUPABASE_ANON_KEY")
@@ -16,164 +49,435 @@ def initialize_clients():
     if not all([supabase_url, supabase_key, openai_api_key]):
         raise ValueError("Missing required environment variables. Please set SUPABASE_URL, SUPABASE_ANON_KEY, and OPENAI_API_KEY")
     
-    supabase: Client = create_client(supabase_url, supabase_key)
-    openai_client = OpenAI(api_key=openai_api_key)
+    supabase: Client = create_client(
+        supabase_url,
+        supabase_key,
+        options=ClientOptions(postgrest_client_timeout=HTTP_TIMEOUT)
+    )
+    # One pooled HTTP client keeps TLS connections alive across embedding requests.
+    # Built-in retries are off so _create_embeddings' backoff is the only retry policy.
+    openai_client = AsyncOpenAI(
+        api_key=openai_api_key,
+        max_retries=0,
+        http_client=httpx.AsyncClient(
+            limits=httpx.Limits(max_keepalive_connections=32, max_connections=64),
+            timeout=HTTP_TIMEOUT
+        )
+    )
     
     return supabase, openai_client
 
+@functools.lru_cache(maxsize=1)
+def _get_encoding():
+    # Loading the BPE ranks is expensive (and may download them), so build the
+    # tokenizer on first use and keep it for the rest of the process
+    return tiktoken.encoding_for_model(EMBEDDING_MODEL)
+
 def extract_text_content(json_doc: Dict[str, Any]) -> str:
-    text_parts = []
-    
-    if "title" in json_doc:
-        text_parts.append(f"Product Title: {json_doc['title']}")
+    text_parts = [fmt(value) for key, fmt in TEXT_FIELDS if (value := json_doc.get(key)) is not None]
     
-    if "description" in json_doc:
-        text_parts.append(f"Description: {json_doc['description']}")
-    
-    if "price" in json_doc:
-        text_parts.append(f"Price: ${json_doc['price']}")
-    
-    if "category" in json_doc and isinstance(json_doc["category"], dict):
-        category_name = json_doc["category"].get("name", "")
+    category = json_doc.get("category")
+    if isinstance(category, dict):
+        category_name = category.get("name", "")
         if category_name:
             text_parts.append(f"Category: {category_name}")
     
     return " ".join(text_parts)
 
-def generate_embedding(text: str, openai_client: OpenAI) -> List[float]:
+async def generate_embedding(text: str, openai_client: AsyncOpenAI) -> List[float]:
     try:
-        response = openai_client.embeddings.create(
-            input=text,
-            model="text-embedding-ada-002"
-        )
-        return response.data[0].embedding
+        return (await _create_embeddings(openai_client, [text]))[0]
     except Exception as e:
-        print(f"Error generating embedding: {e}")
+        logger.error("Error generating embedding: %s", e)
         raise
 
-def create_metadata(json_doc: Dict[str, Any]) -> Dict[str, Any]:
-    metadata = {
-        "product_id": json_doc.get("id"),
-        "title": json_doc.get("title"),
-        "price": json_doc.get("price"),
-        "document_type": "product"
-    }
+MAX_RETRY_WAIT = 60
+
+_backoff = wait_exponential_jitter(initial=1, max=MAX_RETRY_WAIT)
+
+# Failures worth another attempt: rate limits, network blips, timeouts and 5xx responses
+RETRYABLE_ERRORS = (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError)
+
+def _wait_before_retry(retry_state) -> float:
+    """Wait as long as the API's Retry-After header asks, falling back to exponential backoff"""
+    error = retry_state.outcome.exception()
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    try:
+        # Cap the server's hint so one response can't stall ingestion indefinitely
+        return min(float(retry_after), MAX_RETRY_WAIT)
+    except (TypeError, ValueError):
+        return _backoff(retry_state)
+
+@retry(
+    retry=retry_if_exception_type(RETRYABLE_ERRORS),
+    wait=_wait_before_retry,
+    stop=stop_after_attempt(6),
+    reraise=True
+)
+async def _create_embeddings(openai_client: AsyncOpenAI, texts: List[str]) -> List[List[float]]:
+    response = await openai_client.embeddings.create(
+        input=texts,
+        model=EMBEDDING_MODEL
+    )
+    return [d.embedding for d in sorted(response.data, key=lambda d: d.index)]
+
+async def generate_embeddings_batch(texts: List[str], openai_client: AsyncOpenAI, batch_size: int = 512, semaphore: Optional[asyncio.Semaphore] = None) -> List[List[float]]:
+    """Embed many texts with as few requests as possible, preserving input order"""
+    batch_size = min(batch_size, MAX_INPUTS_PER_REQUEST)
+    # Tokenizing is CPU-bound, so it runs in a worker thread to keep the event loop free
+    encoding = await asyncio.to_thread(_get_encoding)
+    # Special-token strings like "<|endoftext|>" are plain text to the embeddings API,
+    # so count them as ordinary tokens instead of rejecting the input
+    encoded = await asyncio.to_thread(
+        encoding.encode_batch,
+        texts,
+        num_threads=max(1, min(len(texts), os.cpu_count() or 1)),
+        disallowed_special=()
+    )
+    
+    # Pack texts into sub-batches bounded by both input count and total tokens
+    sub_batches = []
+    current, current_tokens = [], 0
+    for text, ids in zip(texts, encoded):
+        token_count = len(ids)
+        if token_count > MAX_TOKENS_PER_INPUT:
+            # The API rejects oversized inputs outright, so embed the leading part instead
+            text = encoding.decode(ids[:MAX_TOKENS_PER_INPUT])
+            token_count = MAX_TOKENS_PER_INPUT
+        if current and (len(current) >= batch_size or current_tokens + token_count > MAX_TOKENS_PER_REQUEST):
+            sub_batches.append(current)
+            current, current_tokens = [], 0
+        current.append(text)
+        current_tokens += token_count
+    if current:
+        sub_batches.append(current)
+    
+    # Callers running several batches at once share one semaphore to cap requests across all of them
+    semaphore = semaphore or asyncio.Semaphore(OPENAI_CONCURRENCY)
+    
+    async def embed(sub_batch: List[str]) -> List[List[float]]:
+        async with semaphore:
+            return await _create_embeddings(openai_client, sub_batch)
+    
+    try:
+        # gather returns results in sub-batch order, so the output lines up with texts
+        results = await asyncio.gather(*[embed(sub_batch) for sub_batch in sub_batches])
+        return [embedding for sub_result in results for embedding in sub_result]
+    except Exception as e:
+        logger.error("Error generating embeddings: %s", e)
+        raise
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def lookup_cached_embeddings(supabase: Client, hashes: List[str], model: str = EMBEDDING_MODEL) -> Dict[str, List[float]]:
+    """Fetch previously computed embeddings for the given content hashes"""
+    if not hashes:
+        return {}
+    try:
+        result = supabase.table("embedding_cache").select("hash,embedding").in_("hash", hashes).eq("model", model).execute()
+    except Exception as e:
+        logger.warning("⚠️  Embedding cache lookup failed, embedding everything: %s", e)
+        return {}
+    
+    cached = {}
+    for row in result.data or []:
+        embedding = row["embedding"]
+        # pgvector columns come back from PostgREST in their text form, e.g. "[0.1,0.2,...]"
+        if isinstance(embedding, str):
+            embedding = orjson.loads(embedding)
+        cached[row["hash"]] = embedding
+    return cached
+
+def store_cached_embeddings(supabase: Client, embeddings: Dict[str, List[float]], model: str = EMBEDDING_MODEL):
+    if not embeddings:
+        return
+    rows = [{"hash": h, "model": model, "embedding": e} for h, e in embeddings.items()]
+    try:
+        supabase.table("embedding_cache").upsert(rows).execute()
+    except Exception as e:
+        logger.warning("⚠️  Failed to update embedding cache: %s", e)
+
+async def get_embeddings(supabase: Client, openai_client: AsyncOpenAI, texts: List[str], semaphore: Optional[asyncio.Semaphore] = None) -> List[List[float]]:
+    """Return embeddings for texts, only calling OpenAI for content not already in the cache"""
+    # Identical texts (e.g. boilerplate descriptions) are embedded once and fanned out
+    unique: Dict[str, List[int]] = defaultdict(list)
+    for i, text in enumerate(texts):
+        unique[text].append(i)
+    
+    hashes = {text: text_hash(text) for text in unique}
+    # The Supabase client is synchronous; keep its requests off the event loop
+    cached = await asyncio.to_thread(lookup_cached_embeddings, supabase, list(hashes.values()))
     
+    uncached = [text for text, h in hashes.items() if h not in cached]
+    if cached:
+        logger.debug("  - Reusing %d cached embeddings", len(unique) - len(uncached))
+    
+    if uncached:
+        new_embeddings = await generate_embeddings_batch(uncached, openai_client, semaphore=semaphore)
+        fresh = {}
+        for text, embedding in zip(uncached, new_embeddings):
+            fresh[hashes[text]] = embedding
+        await asyncio.to_thread(store_cached_embeddings, supabase, fresh)
+        cached.update(fresh)
+    
+    embeddings = [None] * len(texts)
+    for text, indices in unique.items():
+        embedding = cached[hashes[text]]
+        for i in indices:
+            embeddings[i] = embedding
+    return embeddings
+
+class CategoryMetadata(msgspec.Struct):
+    id: Any = None
+    name: Optional[str] = None
+    image: Optional[str] = None
+
+class ProductMetadata(msgspec.Struct, omit_defaults=True):
+    product_id: Any
+    title: Optional[str]
+    price: Any
+    document_type: str
+    category: Optional[CategoryMetadata] = None
+    images: Optional[List[Any]] = None
+    image_count: Optional[int] = None
+
+def create_metadata(json_doc: Dict[str, Any]) -> Dict[str, Any]:
     # Handle category information
-    if "category" in json_doc and isinstance(json_doc["category"], dict):
-        metadata["category"] = {
-            "id": json_doc["category"].get("id"),
-            "name": json_doc["category"].get("name"),
-            "image": json_doc["category"].get("image")
-        }
+    category = json_doc.get("category")
+    if isinstance(category, dict):
+        category = CategoryMetadata(
+            id=category.get("id"),
+            name=category.get("name"),
+            image=category.get("image")
+        )
+    else:
+        category = None
     
     # Handle images
-    if "images" in json_doc and isinstance(json_doc["images"], list):
-        metadata["images"] = json_doc["images"]
-        metadata["image_count"] = len(json_doc["images"])
+    images = json_doc.get("images")
+    if not isinstance(images, list):
+        images = None
     
-    return metadata
+    metadata = ProductMetadata(
+        product_id=json_doc.get("id"),
+        title=json_doc.get("title"),
+        price=json_doc.get("price"),
+        document_type="product",
+        category=category,
+        images=images,
+        image_count=len(images) if images is not None else None
+    )
+    return msgspec.to_builtins(metadata)
 
-def load_json_file(file_path: str) -> List[Dict[str, Any]]:
+def iter_documents(file_path: str) -> Iterator[Dict[str, Any]]:
+    """Stream documents from a JSON file holding either a single object or an array of objects"""
     try:
-        with open(file_path, "r", encoding="utf-8") as file:
-            data = json.load(file)
-        
-        if isinstance(data, dict):
-            return [data]
-        elif isinstance(data, list):
-            return data
-        else:
-            raise ValueError("JSON file must contain either a single object or an array of objects")
+        with open(file_path, "rb") as file:
+            # Peek at the first significant byte to tell an array from a single object
+            head = file.read(1)
+            while head.isspace():
+                head = file.read(1)
+            file.seek(0)
+            
+            if head == b"[":
+                yield from ijson.items(file, "item", use_float=True)
+            elif head == b"{":
+                # A single object has to be held in memory anyway, so decode it in one go
+                yield orjson.loads(file.read())
+            else:
+                raise ValueError("JSON file must contain either a single object or an array of objects")
             
     except FileNotFoundError:
         raise FileNotFoundError(f"JSON file not found: {file_path}")
-    except json.JSONDecodeError as e:
+    except (ijson.JSONError, orjson.JSONDecodeError) as e:
         raise ValueError(f"Invalid JSON in file {file_path}: {e}")
 
 def check_table_structure(supabase: Client):
     """Check if the documents table exists and has the correct structure"""
     try:
         # Try to get table info
-        result = supabase.table("documents").select("*").limit(1).execute()
-        print("✅ Documents table exists and is accessible")
+        result = supabase.table("documents").select("id").limit(1).execute()
+        logger.info("✅ Documents table exists and is accessible")
         return True
     except Exception as e:
-        print(f"❌ Error accessing documents table: {e}")
+        logger.error("❌ Error accessing documents table: %s", e)
         return False
 
-def process_and_insert_documents(supabase: Client, openai_client: OpenAI, json_file_path: str, batch_size: int = 10):
-    print(f"Loading products from: {json_file_path}")
+async def connect_database(db_url: str):
+    """Open a direct Postgres connection for bulk loading (requires psycopg and pgvector)"""
+    import psycopg
+    from pgvector.psycopg import register_vector_async
     
-    # Check table structure first
-    if not check_table_structure(supabase):
-        print("❌ Cannot proceed without proper table structure")
+    conn = await psycopg.AsyncConnection.connect(db_url)
+    await register_vector_async(conn)
+    return conn
+
+async def copy_documents(conn, rows: List[Dict[str, Any]]) -> int:
+    """Load rows into the documents table with a binary COPY, bypassing PostgREST's JSON round-trip"""
+    from psycopg.types.json import Jsonb
+    from pgvector import HalfVector
+    
+    async with conn.transaction():
+        async with conn.cursor() as cur:
+            async with cur.copy("COPY documents (content, metadata, embedding) FROM STDIN WITH (FORMAT BINARY)") as copy:
+                copy.set_types(["text", "jsonb", "halfvec"])
+                for row in rows:
+                    await copy.write_row((row["content"], Jsonb(row["metadata"]), HalfVector(row["embedding"])))
+    return len(rows)
+
+async def process_and_insert_documents(supabase: Client, openai_client: AsyncOpenAI, json_file_path: str, batch_size: int = 10, checked: bool = False, db_url: Optional[str] = None):
+    logger.info("Loading products from: %s", json_file_path)
+    
+    # Check table structure first, unless the caller already has
+    if not checked and not check_table_structure(supabase):
+        logger.error("❌ Cannot proceed without proper table structure")
         return 0, 0
     
-    documents = load_json_file(json_file_path)
-    print(f"Found {len(documents)} products to process")
+    # With a direct database URL, batches are bulk loaded with COPY instead of REST inserts
+    db_conn = None
+    if db_url:
+        logger.info("🚚 Bulk loading through a direct Postgres connection")
+        db_conn = await connect_database(db_url)
+    
+    documents = iter_documents(json_file_path)
+    processed = 0
     
     successful_inserts = 0
     failed_inserts = 0
     
-    for i in range(0, len(documents), batch_size):
-        batch = documents[i:i + batch_size]
-        print(f"\nProcessing batch {i//batch_size + 1}/{(len(documents) + batch_size - 1)//batch_size}")
+    # Embedding of the next batch overlaps with insertion of the current one;
+    # the small bound keeps the producer from running far ahead of the inserts
+    queue: asyncio.Queue = asyncio.Queue(maxsize=2)
+    
+    # One semaphore for the whole run caps embedding requests in flight across all batches
+    semaphore = asyncio.Semaphore(OPENAI_CONCURRENCY)
+    
+    async def prepare(batch_number: int, start: int, batch: List[Dict[str, Any]]) -> Optional[List[Dict[str, Any]]]:
+        nonlocal failed_inserts
+        texts = [extract_text_content(doc) for doc in batch]
         
-        for j, doc in enumerate(batch):
-            doc_index = i + j + 1
-            print(f"Processing product {doc_index}/{len(documents)}")
-            
-            try:
-                text_content = extract_text_content(doc)
-                print(f"  - Extracted {len(text_content)} characters of text")
-                
-                print("  - Generating embedding...")
-                embedding = generate_embedding(text_content, openai_client)
-                
-                metadata = create_metadata(doc)
+        if logger.isEnabledFor(logging.DEBUG):
+            for doc_index, text_content in enumerate(texts, start + 1):
+                logger.debug("  - Product %d: %d characters of text", doc_index, len(text_content))
+        
+        # Skip products with no usable text rather than spending an embedding request on them
+        usable = []
+        for doc_index, (doc, text_content) in enumerate(zip(batch, texts), start + 1):
+            if len(text_content.strip()) < MIN_TEXT_LENGTH:
+                logger.warning("⚠️  Skipping product %d: no usable text content", doc_index)
+                failed_inserts += 1
+            else:
+                usable.append((doc, text_content))
+        if not usable:
+            return None
+        batch = [doc for doc, _ in usable]
+        texts = [text_content for _, text_content in usable]
+        
+        try:
+            logger.debug("  - Generating embeddings for %d products...", len(texts))
+            embeddings = await get_embeddings(supabase, openai_client, texts, semaphore)
+            return [
+                {"content": text_content, "metadata": create_metadata(doc), "embedding": embedding}
+                for doc, text_content, embedding in zip(batch, texts, embeddings)
+            ]
+        except Exception as e:
+            logger.error("❌ Failed to prepare batch %d: %s", batch_number, e)
+            failed_inserts += len(batch)
+            return None
+    
+    async def produce():
+        nonlocal processed
+        batch_number = 0
+        # Up to OPENAI_CONCURRENCY batches are embedded at once; they are queued in input order
+        in_flight = deque()
+        
+        async def enqueue_oldest():
+            number, task = in_flight.popleft()
+            rows = await task
+            if rows:
+                await queue.put((number, rows))
+        
+        try:
+            while batch := list(itertools.islice(documents, batch_size)):
+                start = processed
+                processed += len(batch)
+                batch_number += 1
+                logger.debug("Embedding batch %d (products %d-%d)", batch_number, start + 1, processed)
                 
-                print("  - Preparing data for insertion...")
-                insert_data = {
-                    "content": text_content,
-                    "metadata": metadata,
-                    "embedding": embedding
-                }
+                in_flight.append((batch_number, asyncio.create_task(prepare(batch_number, start, batch))))
+                if len(in_flight) >= OPENAI_CONCURRENCY:
+                    await enqueue_oldest()
+        finally:
+            # Batches already being embedded are still inserted, even if reading the input failed;
+            # then always release the consumer
+            while in_flight:
+                await enqueue_oldest()
+            await queue.put(None)
+    
+    async def consume():
+        nonlocal successful_inserts, failed_inserts
+        while (item := await queue.get()) is not None:
+            batch_number, rows = item
+            row_count = len(rows)
+            try:
+                logger.debug("  - Inserting batch %d (%d products) into Supabase...", batch_number, row_count)
+                if db_conn is not None:
+                    inserted = await copy_documents(db_conn, rows)
+                else:
+                    # The Supabase client is synchronous; run it in a thread so embedding can continue
+                    result = await asyncio.to_thread(lambda: supabase.table("documents").insert(rows).execute())
+                    inserted = len(result.data or [])
+                    
+                    if logger.isEnabledFor(logging.DEBUG):
+                        for row in result.data or []:
+                            logger.debug("  ✅ Inserted product with id: %s", row.get('id', 'unknown'))
                 
-                print("  - Inserting into Supabase...")
-                result = supabase.table("documents").insert(insert_data).execute()
+                successful_inserts += inserted
+                failed_inserts += row_count - inserted
                 
-                if result.data and len(result.data) > 0:
-                    print(f"  ✅ Successfully inserted product with id: {result.data[0].get('id', 'unknown')}")
-                    successful_inserts += 1
+                if inserted == row_count:
+                    logger.info("✅ Inserted %d products from batch %d (%d so far)", inserted, batch_number, successful_inserts)
                 else:
-                    print(f"  ❌ Insert returned no data: {result}")
-                    failed_inserts += 1
-                
-                time.sleep(0.5)
+                    logger.error("❌ Insert returned %d of %d rows", inserted, row_count)
                 
             except Exception as e:
-                print(f"  ❌ Failed to insert product {doc_index}: {e}")
-                print(f"  📝 Error details: {type(e).__name__}")
+                logger.error("❌ Failed to insert batch %d of %d products: %s", batch_number, row_count, e)
+                logger.error("  📝 Error details: %s", type(e).__name__)
                 
                 # Print more detailed error information
                 if hasattr(e, 'args') and e.args:
-                    print(f"  📝 Error args: {e.args}")
+                    logger.error("  📝 Error args: %s", e.args)
                 
-                failed_inserts += 1
-                continue
+                failed_inserts += row_count
     
-    print(f"\n📊 Summary:")
-    print(f"✅ Successfully inserted: {successful_inserts} products")
-    print(f"❌ Failed to insert: {failed_inserts} products")
-    if successful_inserts + failed_inserts > 0:
-        print(f"📈 Success rate: {(successful_inserts/(successful_inserts+failed_inserts)*100):.1f}%")
+    consumer = asyncio.create_task(consume())
+    try:
+        try:
+            await produce()
+        finally:
+            # produce() always queues the sentinel, so this returns once every queued
+            # batch has been inserted, even when reading or embedding failed part way
+            await consumer
+    finally:
+        # Only close the COPY connection once the consumer can no longer be using it
+        if db_conn is not None:
+            await db_conn.close()
+    
+    logger.info("\n📊 Summary:")
+    logger.info("📦 Processed: %d products", processed)
+    logger.info("✅ Successfully inserted: %d products", successful_inserts)
+    logger.info("❌ Failed to insert: %d products", failed_inserts)
+    attempted = successful_inserts + failed_inserts
+    if attempted > 0:
+        logger.info("📈 Success rate: %.1f%%", successful_inserts / attempted * 100)
     
     return successful_inserts, failed_inserts
 
-def search_documents(supabase: Client, openai_client: OpenAI, query: str, match_count: int = 5, filter_metadata: Dict = None) -> List[Dict[str, Any]]:
+async def search_documents(supabase: Client, openai_client: AsyncOpenAI, query: str, match_count: int = 5, filter_metadata: Dict = None) -> List[Dict[str, Any]]:
     try:
-        query_embedding = generate_embedding(query, openai_client)
+        query_embedding = await generate_embedding(query, openai_client)
         
         filter_json = filter_metadata or {}
         
@@ -186,26 +490,26 @@ def search_documents(supabase: Client, openai_client: OpenAI, query: str, match_
         return result.data
         
     except Exception as e:
-        print(f"Error searching documents: {e}")
+        logger.error("Error searching documents: %s", e)
         raise
 
 def check_and_create_table(supabase: Client):
     """Check if documents table exists and create it if it doesn't"""
     try:
-        print("🔍 Checking if documents table exists...")
+        logger.info("🔍 Checking if documents table exists...")
         # Try to select from the table
         result = supabase.table("documents").select("id").limit(1).execute()
-        print("✅ Documents table exists and is accessible")
+        logger.info("✅ Documents table exists and is accessible")
         return True
     except Exception as e:
-        print(f"❌ Documents table check failed: {e}")
-        print("📝 This usually means the table doesn't exist or there are permission issues")
+        logger.error("❌ Documents table check failed: %s", e)
+        logger.error("📝 This usually means the table doesn't exist or there are permission issues")
         return False
 
 def create_table_sql():
     """Return the SQL to create the documents table"""
     return """
--- Enable the vector extension (required for embeddings)
+-- Enable the vector extension (required for embeddings; HALFVEC needs pgvector 0.7+)
 CREATE EXTENSION IF NOT EXISTS vector;
 
 -- Create the documents table
@@ -213,15 +517,25 @@ CREATE TABLE IF NOT EXISTS documents (
     id BIGSERIAL PRIMARY KEY,
     content TEXT NOT NULL,
     metadata JSONB DEFAULT '{}',
-    embedding VECTOR(1536),  -- OpenAI ada-002 uses 1536 dimensions
+    embedding HALFVEC(1536),  -- OpenAI ada-002 uses 1536 dimensions, stored at half precision
     created_at TIMESTAMPTZ DEFAULT NOW()
 );
 
 -- Create an index on the embedding column for faster similarity searches
-CREATE INDEX IF NOT EXISTS documents_embedding_idx ON documents USING ivfflat (embedding vector_cosine_ops);
+CREATE INDEX IF NOT EXISTS documents_embedding_idx ON documents USING ivfflat (embedding halfvec_cosine_ops);
+
+-- Cache of computed embeddings keyed by SHA-256 of the embedded text
+CREATE TABLE IF NOT EXISTS embedding_cache (
+    hash TEXT NOT NULL,
+    model TEXT NOT NULL,
+    embedding VECTOR(1536),
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    PRIMARY KEY (hash, model)
+);
 
 -- Disable RLS for now (you can enable it later with proper policies)
 ALTER TABLE documents DISABLE ROW LEVEL SECURITY;
+ALTER TABLE embedding_cache DISABLE ROW LEVEL SECURITY;
 
 -- Create the RPC function for similarity search
 CREATE OR REPLACE FUNCTION match_docs(
@@ -243,10 +557,10 @@ BEGIN
         documents.id,
         documents.content,
         documents.metadata,
-        1 - (documents.embedding <=> query_embedding) AS similarity
+        1 - (documents.embedding <=> query_embedding::halfvec(1536)) AS similarity
     FROM documents
     WHERE documents.metadata @> filter
-    ORDER BY documents.embedding <=> query_embedding
+    ORDER BY documents.embedding <=> query_embedding::halfvec(1536)
     LIMIT match_count;
 END;
 $;
@@ -255,7 +569,7 @@ $;
 def test_simple_insert(supabase: Client):
     """Test a simple insert without embeddings to check basic connectivity"""
     try:
-        print("🧪 Testing simple insert...")
+        logger.info("🧪 Testing simple insert...")
         test_data = {
             "content": "Test content",
             "metadata": {"test": True, "document_type": "test"}
@@ -264,92 +578,103 @@ def test_simple_insert(supabase: Client):
         result = supabase.table("documents").insert(test_data).execute()
         
         if result.data:
-            print("✅ Simple insert successful")
+            logger.info("✅ Simple insert successful")
             # Clean up test data
             test_id = result.data[0].get('id')
             if test_id:
                 supabase.table("documents").delete().eq('id', test_id).execute()
-                print("🧹 Cleaned up test data")
+                logger.info("🧹 Cleaned up test data")
             return True
         else:
-            print("❌ Simple insert failed - no data returned")
+            logger.error("❌ Simple insert failed - no data returned")
             return False
             
     except Exception as e:
-        print(f"❌ Simple insert failed: {e}")
+        logger.error("❌ Simple insert failed: %s", e)
         return False
 
-def main():
+async def main():
+    # Only this module follows LOG_LEVEL; the root logger stays at WARNING so
+    # httpx/openai don't log a line for every request
+    logging.basicConfig(format="%(message)s")
+    log_level = (os.getenv("LOG_LEVEL") or "INFO").upper()
+    if isinstance(logging.getLevelName(log_level), int):
+        logger.setLevel(log_level)
+    else:
+        logger.setLevel(logging.INFO)
+        logger.warning("⚠️  Unknown LOG_LEVEL %r, using INFO", log_level)
     JSON_FILE_PATH = "db.json"
     
     try:
-        print("🔌 Initializing Supabase and OpenAI clients...")
+        logger.info("🔌 Initializing Supabase and OpenAI clients...")
         supabase, openai_client = initialize_clients()
-        print("✅ Clients initialized successfully")
+        logger.info("✅ Clients initialized successfully")
         
         # Check if table exists
         if not check_and_create_table(supabase):
-            print("\n🛠️  SETUP REQUIRED:")
-            print("Your Supabase database needs the 'documents' table and RPC function.")
-            print("\n📋 Please run this SQL in your Supabase SQL Editor:")
-            print("=" * 60)
-            print(create_table_sql())
-            print("=" * 60)
-            print("\n📍 Steps to fix:")
-            print("1. Go to your Supabase Dashboard")
-            print("2. Navigate to 'SQL Editor' in the left sidebar")
-            print("3. Copy and paste the SQL above")
-            print("4. Click 'Run' to execute the SQL")
-            print("5. Run this script again")
-            print("\n💡 Make sure you're using the correct SUPABASE_URL and SUPABASE_ANON_KEY")
+            logger.warning("\n🛠️  SETUP REQUIRED:")
+            logger.warning("Your Supabase database needs the 'documents' table and RPC function.")
+            logger.warning("\n📋 Please run this SQL in your Supabase SQL Editor:")
+            logger.warning("=" * 60)
+            logger.warning(create_table_sql())
+            logger.warning("=" * 60)
+            logger.warning("\n📍 Steps to fix:")
+            logger.warning("1. Go to your Supabase Dashboard")
+            logger.warning("2. Navigate to 'SQL Editor' in the left sidebar")
+            logger.warning("3. Copy and paste the SQL above")
+            logger.warning("4. Click 'Run' to execute the SQL")
+            logger.warning("5. Run this script again")
+            logger.warning("\n💡 Make sure you're using the correct SUPABASE_URL and SUPABASE_ANON_KEY")
             return
         
         # Test basic connectivity
         if not test_simple_insert(supabase):
-            print("❌ Basic connectivity test failed even with table present.")
-            print("💡 Check your Supabase credentials and permissions.")
+            logger.error("❌ Basic connectivity test failed even with table present.")
+            logger.error("💡 Check your Supabase credentials and permissions.")
             return
         
-        print(f"\n📄 Starting product processing from: {JSON_FILE_PATH}")
-        successful, failed = process_and_insert_documents(
+        logger.info("\n📄 Starting product processing from: %s", JSON_FILE_PATH)
+        successful, failed = await process_and_insert_documents(
             supabase, 
             openai_client, 
             JSON_FILE_PATH,
-            batch_size=5
+            batch_size=5,
+            checked=True,
+            db_url=os.getenv("SUPABASE_DB_URL")
         )
         
         if successful > 0:
-            print(f"\n🎉 Process completed! {successful} products added to your Supabase vector store.")
+            logger.info("\n🎉 Process completed! %d products added to your Supabase vector store.", successful)
             
-            print("\n🔍 Testing search functionality...")
-            search_results = search_documents(
+            logger.info("\n🔍 Testing search functionality...")
+            search_results = await search_documents(
                 supabase, 
                 openai_client, 
                 "wooden dining table mid-century modern",
                 match_count=3
             )
             
-            print(f"Found {len(search_results)} similar products:")
+            logger.info("Found %d similar products:", len(search_results))
             for i, result in enumerate(search_results):
-                print(f"\nResult {i+1}:")
-                print(f"  Similarity: {result['similarity']:.4f}")
-                print(f"  Product: {result['metadata'].get('title', 'N/A')}")
-                print(f"  Price: ${result['metadata'].get('price', 'N/A')}")
+                logger.info("\nResult %d:", i+1)
+                logger.info("  Similarity: %.4f", result['similarity'])
+                logger.info("  Product: %s", result['metadata'].get('title', 'N/A'))
+                logger.info("  Price: $%s", result['metadata'].get('price', 'N/A'))
                 category = result['metadata'].get('category', {})
                 if isinstance(category, dict):
-                    print(f"  Category: {category.get('name', 'N/A')}")
+                    logger.info("  Category: %s", category.get('name', 'N/A'))
         else:
-            print("❌ No products were successfully inserted.")
+            logger.error("❌ No products were successfully inserted.")
             
     except Exception as e:
-        print(f"❌ Error: {e}")
-        print("\nPlease check:")
-        print("1. Your environment variables are set correctly")
-        print("2. Your JSON file exists and is valid")
-        print("3. Your Supabase database is accessible")
-        print("4. Your OpenAI API key is valid")
-        print("5. Your 'documents' table exists with correct schema")
-        print("6. Your 'match_docs' RPC function is properly set up")
+        logger.error("❌ Error: %s", e)
+        logger.error("\nPlease check:")
+        logger.error("1. Your environment variables are set correctly")
+        logger.error("2. Your JSON file exists and is valid")
+        logger.error("3. Your Supabase database is accessible")
+        logger.error("4. Your OpenAI API key is valid")
+        logger.error("5. Your 'documents' table exists with correct schema")
+        logger.error("6. Your 'match_docs' RPC function is properly set up")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    asyncio.run(main())
\ No newline at end of file